@@ -1,11 +1,18 @@
 import os
 import json
+import shutil
 import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 from io import BytesIO
 from PIL import Image
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 BASE_UPLOAD_URL = "https://programacaotvhoje.com/wp-content/uploads/downloaded-images"
 MAX_THREADS = 15
 TIMEOUT = 20
@@ -13,6 +20,13 @@ ROOT_DIR = os.getcwd()
 SCHEDULE_DIR = os.path.join(ROOT_DIR, "schedule")
 DOWNLOAD_DIR = os.path.join(ROOT_DIR, "downloaded-images")
 
+# Keep-alive connections to the image CDN, one per download thread
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_maxsize=MAX_THREADS))
+
+# Images already saved for the other day are reused instead of downloaded again
+OTHER_DAY = {"today": "tomorrow", "tomorrow": "today"}
+
 def webp_filename(url):
     name = os.path.basename(urlparse(url).path)
     base, _ = os.path.splitext(name)
@@ -21,7 +35,7 @@ def webp_filename(url):
 def download_and_convert(task):
     url, save_path = task
     try:
-        r = requests.get(url, timeout=TIMEOUT)
+        r = SESSION.get(url, timeout=TIMEOUT)
         r.raise_for_status()
         image = Image.open(BytesIO(r.content)).convert("RGB")
         
@@ -37,23 +51,48 @@ def download_and_convert(task):
             size = buffer.tell()
             
             if size <= max_size_bytes:
-                buffer.seek(0)
-                with open(save_path, "wb") as f:
-                    f.write(buffer.read())
-                return True, url
+                break
             
             quality -= 5
         
-        # If still too large, save with minimum quality
-        image.save(save_path, "WEBP", quality=min_quality)
+        # If still too large, the minimum quality encoding is kept.
+        # Written via a temp file so a half-written image is never reused.
+        tmp_path = save_path + ".part"
+        with open(tmp_path, "wb") as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, save_path)
         return True, url
         
     except Exception:
         return False, url
 
-def process_json(json_path, day):
+def encode_json(data):
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+
+def save_json(path, data):
+    content = encode_json(data)
+    
+    # Leave identical files untouched (e.g. logos already rewritten by an earlier run)
+    with open(path, "rb") as f:
+        if f.read() == content:
+            return
+    
+    tmp_path = path + ".part"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+def copy_image(src, dst):
+    # Through a .part file like downloads, so dst is never half-written
+    shutil.copyfile(src, dst + ".part")
+    os.replace(dst + ".part", dst)
+
+def process_json(json_path, day, executor, queued, copies):
     channel_slug = os.path.splitext(os.path.basename(json_path))[0]
     output_dir = os.path.join(DOWNLOAD_DIR, channel_slug, day)
+    other_dir = os.path.join(DOWNLOAD_DIR, channel_slug, OTHER_DAY[day])
     os.makedirs(output_dir, exist_ok=True)
     
     with open(json_path, "r", encoding="utf-8") as f:
@@ -73,30 +112,45 @@ def process_json(json_path, day):
             unique_urls[logo_url] = filename
             
             if not os.path.exists(local_path):
-                download_tasks.append((logo_url, local_path))
+                other_path = os.path.join(other_dir, filename)
+                if other_path in queued:
+                    # Still downloading for the other day; copied once the pool drains
+                    copies.append((other_path, local_path))
+                elif os.path.exists(other_path):
+                    copy_image(other_path, local_path)
+                else:
+                    download_tasks.append((logo_url, local_path))
         
         show["show_logo"] = (
             f"{BASE_UPLOAD_URL}/{channel_slug}/{day}/{unique_urls[logo_url]}"
         )
     
-    if download_tasks:
-        with ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
-            futures = [executor.submit(download_and_convert, t) for t in download_tasks]
-            for _ in as_completed(futures):
-                pass
+    # Downloads run on the shared pool; main() waits for all of them at the end
+    for task in download_tasks:
+        queued.add(task[1])
+        executor.submit(download_and_convert, task)
     
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    save_json(json_path, data)
 
 def main():
-    for day in ["today", "tomorrow"]:
-        day_dir = os.path.join(SCHEDULE_DIR, day)
-        if not os.path.isdir(day_dir):
-            continue
-        
-        for file in os.listdir(day_dir):
-            if file.endswith(".json"):
-                process_json(os.path.join(day_dir, file), day)
+    # Local paths being downloaded this run, and copies waiting on them
+    queued = set()
+    copies = []
+    
+    with ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
+        for day in ["today", "tomorrow"]:
+            day_dir = os.path.join(SCHEDULE_DIR, day)
+            if not os.path.isdir(day_dir):
+                continue
+            
+            for file in os.listdir(day_dir):
+                if file.endswith(".json"):
+                    process_json(os.path.join(day_dir, file), day, executor, queued, copies)
+    
+    # A failed download leaves nothing to copy, as it would have for either day
+    for src, dst in copies:
+        if os.path.exists(src):
+            copy_image(src, dst)
 
 if __name__ == "__main__":
     main()
@@ -2,25 +2,46 @@ import requests
 import json
 import os
 import re
-from bs4 import BeautifulSoup
-from datetime import datetime, timedelta, time
+from lxml import etree
+import lxml.html
+from datetime import datetime, timedelta
 from concurrent.futures import ThreadPoolExecutor
-import pytz
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 BASE_URL = "https://mi.tv/br/async/channel"
-TIMEZONE = pytz.timezone("America/Sao_Paulo")
+# Yesterday, today and tomorrow pages, relative to a channel's URL
+DAY_PAGES = ("ontem/330", "330", "amanha/330")
+TIMEZONE = ZoneInfo("America/Sao_Paulo")
+
+# Day windows as (first, last) start times, in minutes since midnight
+NIGHT = (0, 5 * 60 + 29)
+DAY = (5 * 60 + 30, 23 * 60 + 59)
 
-START_DAY = time(5, 30)
-END_DAY = time(23, 59)
-MIDNIGHT = time(0, 0)
-END_NIGHT = time(5, 29)
+# "HH:MM" for every minute of the day, indexed by minutes since midnight
+TIME_STRINGS = [f"{h:02d}:{m:02d}" for h in range(24) for m in range(60)]
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0"
 }
 
-os.makedirs("schedule/today", exist_ok=True)
-os.makedirs("schedule/tomorrow", exist_ok=True)
+# Shared by all workers so connections to mi.tv are kept alive between pages
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+
+# background-image: url('...') on a show's image element
+LOGO_URL = re.compile(r"url\('(.+?)'\)")
+
+# Every <li> inside a <ul class="... broadcasts ...">
+BROADCAST_ITEMS = etree.XPath('//ul[contains(concat(" ", normalize-space(@class), " "), " broadcasts ")]//li')
+
+# <?xml ...?> at the start of a page; lxml refuses it on already-decoded text
+XML_DECLARATION = re.compile(r"^\s*<\?xml[^>]*\?>")
 
 LOG_FILE = "epg.log"
 
@@ -31,101 +52,131 @@ def log(msg):
 
 
 def fetch_html(url):
-    r = requests.get(url, headers=HEADERS, timeout=20)
+    r = SESSION.get(url, timeout=20)
     r.raise_for_status()
     return r.text
 
 
-def parse_shows(html):
-    soup = BeautifulSoup(html, "html.parser")
-    shows = []
+@lru_cache(maxsize=None)
+def parse_time(value):
+    hours, minutes = value.split(":")
+    hours, minutes = int(hours), int(minutes)
+    # Same range check time() did, so bad data still fails the channel
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(value)
+    return hours * 60 + minutes
 
-    for li in soup.select("ul.broadcasts li"):
-        time_el = li.select_one(".time")
-        title_el = li.select_one("h2")
-        desc_el = li.select_one(".synopsis")
-        cat_el = li.select_one(".sub-title")
-        img_el = li.select_one(".image")
 
-        if not time_el or not title_el:
+def parse_shows(html):
+    shows = []
+    # etree.HTML rather than lxml.html.document_fromstring: it returns None
+    # for an empty page instead of raising, and an empty page has no shows
+    try:
+        root = etree.HTML(html, lxml.html.html_parser)
+    except ValueError:
+        root = etree.HTML(XML_DECLARATION.sub("", html, count=1), lxml.html.html_parser)
+    if root is None:
+        return shows
+
+    for li in BROADCAST_ITEMS(root):
+        # One walk over the item, keeping the first element for each class
+        by_class = {}
+        title_el = None
+        for el in li.iterdescendants(etree.Element):
+            if el.tag == "h2" and title_el is None:
+                title_el = el
+            for cls in el.get("class", "").split():
+                by_class.setdefault(cls, el)
+
+        time_el = by_class.get("time")
+        desc_el = by_class.get("synopsis")
+        cat_el = by_class.get("sub-title")
+        img_el = by_class.get("image")
+
+        if time_el is None or title_el is None:
             continue
 
-        start_time = time_el.text.strip()
-        category = cat_el.text.strip() if cat_el else ""
+        start_time = time_el.text_content().strip()
+        category = cat_el.text_content().strip() if cat_el is not None else ""
 
         logo = ""
-        if img_el and "background-image" in img_el.get("style", ""):
-            match = re.search(r"url\('(.+?)'\)", img_el["style"])
+        if img_el is not None and "background-image" in img_el.get("style", ""):
+            match = LOGO_URL.search(img_el.get("style"))
             if match:
                 logo = match.group(1)
 
-        shows.append({
-            "show_name": title_el.text.strip(),
-            "start_time": start_time,
-            "show_logo": logo,
-            "show_category": category,
-            "episode_description": desc_el.text.strip() if desc_el else ""
-        })
+        # (show_name, start_time, show_logo, show_category, episode_description)
+        shows.append((
+            title_el.text_content().strip(),
+            start_time,
+            logo,
+            category,
+            desc_el.text_content().strip() if desc_el is not None else ""
+        ))
 
     return shows
 
 
-def build_schedule(shows, target_date):
-    schedule = []
+def build_schedule(shows, *windows):
+    # One schedule per window; shows starting outside every window are skipped
+    schedules = [[] for _ in windows]
+    start_times = [parse_time(show[1]) for show in shows]
 
-    for i, show in enumerate(shows):
-        start_t = datetime.strptime(show["start_time"], "%H:%M").time()
-        start_dt = TIMEZONE.localize(datetime.combine(target_date, start_t))
+    for i, (name, _, logo, category, description) in enumerate(shows):
+        start = start_times[i]
+
+        for schedule, (first, last) in zip(schedules, windows):
+            if first <= start <= last:
+                break
+        else:
+            continue
 
         if i + 1 < len(shows):
-            next_t = datetime.strptime(shows[i + 1]["start_time"], "%H:%M").time()
-            end_dt = TIMEZONE.localize(datetime.combine(target_date, next_t))
+            end = start_times[i + 1]
         else:
-            end_dt = start_dt + timedelta(minutes=30)
+            end = (start + 30) % len(TIME_STRINGS)
 
         schedule.append({
-            "show_name": show["show_name"],
-            "show_logo": show["show_logo"],
-            "show_category": show["show_category"],
-            "start_time": start_dt.strftime("%H:%M"),
-            "end_time": end_dt.strftime("%H:%M"),
-            "episode_description": show["episode_description"]
+            "show_name": name,
+            "show_logo": logo,
+            "show_category": category,
+            "start_time": TIME_STRINGS[start],
+            "end_time": TIME_STRINGS[end],
+            "episode_description": description
         })
 
-    return schedule
+    return schedules
 
 
-def filter_by_time(schedule, start_time, end_time):
-    return [
-        s for s in schedule
-        if start_time <= datetime.strptime(s["start_time"], "%H:%M").time() <= end_time
-    ]
+def encode_json(data):
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
 
 
-def process_channel(channel):
-    try:
-        log(f"START channel: {channel}")
+def save_schedule(path, data):
+    # Written to a temp file first so a crash never leaves a truncated schedule
+    tmp_path = path + ".part"
+    with open(tmp_path, "wb") as f:
+        f.write(encode_json(data))
+    os.replace(tmp_path, path)
+
+
+def fetch_shows(channel, page):
+    return parse_shows(fetch_html(f"{BASE_URL}/{channel}/{page}"))
 
-        html_y = fetch_html(f"{BASE_URL}/{channel}/ontem/330")
-        html_t = fetch_html(f"{BASE_URL}/{channel}/330")
-        html_tm = fetch_html(f"{BASE_URL}/{channel}/amanha/330")
 
-        shows_y = parse_shows(html_y)
-        shows_t = parse_shows(html_t)
-        shows_tm = parse_shows(html_tm)
+def process_channel(channel, pages, today, tomorrow):
+    try:
+        log(f"START channel: {channel}")
 
-        today_date = datetime.now(TIMEZONE).date()
-        tomorrow_date = today_date + timedelta(days=1)
+        shows_y, shows_t, shows_tm = (page.result() for page in pages)
 
-        today_schedule = (
-            filter_by_time(build_schedule(shows_y, today_date), MIDNIGHT, END_NIGHT)
-            + filter_by_time(build_schedule(shows_t, today_date), START_DAY, END_DAY)
-        )
+        # Today's page feeds both days: its daytime shows and the night after it
+        night_t, day_t = build_schedule(shows_t, NIGHT, DAY)
 
-        tomorrow_schedule = (
-            filter_by_time(build_schedule(shows_t, tomorrow_date), MIDNIGHT, END_NIGHT)
-            + filter_by_time(build_schedule(shows_tm, tomorrow_date), START_DAY, END_DAY)
-        )
+        today_schedule = build_schedule(shows_y, NIGHT)[0] + day_t
+        tomorrow_schedule = night_t + build_schedule(shows_tm, DAY)[0]
 
         filename = channel.lower().replace("_", "-") + ".json"
         channel_name = channel.replace("-", " ").title()
@@ -135,23 +186,21 @@ def process_channel(channel):
         if not today_schedule:
             log(f"SKIPPED today → {channel} (no shows found)")
         else:
-            with open(f"schedule/today/{filename}", "w", encoding="utf-8") as f:
-                json.dump({
-                    "channel": channel_name,
-                    "date": today_date.strftime("%d/%m/%Y"),
-                    "schedule": today_schedule
-                }, f, ensure_ascii=False, indent=2)
+            save_schedule(f"schedule/today/{filename}", {
+                "channel": channel_name,
+                "date": today,
+                "schedule": today_schedule
+            })
             log(f"SAVED today → schedule/today/{filename} ({len(today_schedule)} shows)")
 
         if not tomorrow_schedule:
             log(f"SKIPPED tomorrow → {channel} (no shows found)")
         else:
-            with open(f"schedule/tomorrow/{filename}", "w", encoding="utf-8") as f:
-                json.dump({
-                    "channel": channel_name,
-                    "date": tomorrow_date.strftime("%d/%m/%Y"),
-                    "schedule": tomorrow_schedule
-                }, f, ensure_ascii=False, indent=2)
+            save_schedule(f"schedule/tomorrow/{filename}", {
+                "channel": channel_name,
+                "date": tomorrow,
+                "schedule": tomorrow_schedule
+            })
             log(f"SAVED tomorrow → schedule/tomorrow/{filename} ({len(tomorrow_schedule)} shows)")
 
     except Exception as e:
@@ -160,12 +209,27 @@ def process_channel(channel):
 
 def main():
     open(LOG_FILE, "w", encoding="utf-8").close()
+    os.makedirs("schedule/today", exist_ok=True)
+    os.makedirs("schedule/tomorrow", exist_ok=True)
 
     with open("channel.txt", "r", encoding="utf-8") as f:
-        channels = [c.strip() for c in f if c.strip()]
+        channels = f.read().split()
+
+    # Resolved once so every channel agrees on the dates, even across midnight
+    today_date = datetime.now(TIMEZONE).date()
+    tomorrow_date = today_date + timedelta(days=1)
+    today = today_date.strftime("%d/%m/%Y")
+    tomorrow = tomorrow_date.strftime("%d/%m/%Y")
 
     with ThreadPoolExecutor(max_workers=6) as executor:
-        executor.map(process_channel, channels)
+        # Queue every page up front, then assemble channels in channel.txt order,
+        # each one waiting for its own pages while later pages keep downloading
+        pending = []
+        for channel in channels:
+            pending.append((channel, [executor.submit(fetch_shows, channel, page) for page in DAY_PAGES]))
+
+        for channel, pages in pending:
+            process_channel(channel, pages, today, tomorrow)
 
 
 if __name__ == "__main__":